@@ -142,6 +142,19 @@ export const streamFile = async (
   }
 };
 
+/**
+ * Get the URL of a resized image preview, for use as an <img> src
+ */
+export const getPreviewUrl = (
+  fileId: string,
+  width: number = 256,
+  height: number = 256,
+  format: 'webp' | 'jpeg' | 'png' = 'webp'
+): string => {
+  const params = new URLSearchParams({ w: String(width), h: String(height), format });
+  return `${FILE_SERVICE_URL}/preview/${fileId}?${params}`;
+};
+
 /**
  * Get file metadata
  */
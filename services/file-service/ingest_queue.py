@@ -0,0 +1,222 @@
+from typing import List, Dict, Any, Optional
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+
+# File types whose content can be indexed for RAG as plain text
+TEXT_CONTENT_TYPES = {
+    "application/json",
+    "application/xml",
+    "application/x-yaml",
+    "application/yaml",
+    "application/x-ndjson",
+}
+TEXT_EXTENSIONS = {
+    ".txt", ".md", ".markdown", ".rst", ".csv", ".tsv", ".json",
+    ".xml", ".yaml", ".yml", ".html", ".htm", ".log",
+}
+
+
+def is_text_like(content_type: str, filename: str) -> bool:
+    """Check whether an upload should be ingested into the RAG index"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type.startswith("text/") or content_type in TEXT_CONTENT_TYPES:
+        return True
+    return Path(filename or "").suffix.lower() in TEXT_EXTENSIONS
+
+
+class IngestQueue:
+    """Durable SQLite-backed queue of RAG ingestion jobs, keyed by file ID.
+
+    The database uses a rollback journal rather than WAL, since WAL needs
+    shared memory on a single host and breaks on network filesystems. When
+    several pods share the file, the volume must support POSIX advisory
+    locks (e.g. NFSv4); ``threading.Lock`` only serialises this process.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        lease_seconds: float = 300.0,
+        max_attempts: int = 5,
+        retry_base_seconds: float = 5.0,
+        retry_max_seconds: float = 600.0,
+    ):
+        self.db_path = Path(db_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            str(self.db_path), check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                file_id TEXT PRIMARY KEY,
+                op TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                leased_until REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ingest_ready "
+            "ON ingest_jobs (status, available_at)"
+        )
+
+    def enqueue(self, file_id: str, op: str):
+        """Record a job for a file, replacing any job still pending for it.
+
+        Only the latest operation per file matters, so an ``index`` followed
+        by a ``delete`` collapses to the ``delete``. The version bump makes
+        a stale in-flight claim unable to ack the newer job.
+        """
+        if op not in ("index", "delete"):
+            raise ValueError(f"Unknown ingest operation: {op}")
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO ingest_jobs
+                    (file_id, op, version, status, attempts, available_at,
+                     leased_until, last_error, updated_at)
+                VALUES (?, ?, 1, 'pending', 0, ?, 0, NULL, ?)
+                ON CONFLICT(file_id) DO UPDATE SET
+                    op = excluded.op,
+                    version = ingest_jobs.version + 1,
+                    status = 'pending',
+                    attempts = 0,
+                    available_at = excluded.available_at,
+                    leased_until = 0,
+                    last_error = NULL,
+                    updated_at = excluded.updated_at
+                """,
+                (file_id, op, now, now),
+            )
+
+    def claim(self, limit: int) -> List[Dict[str, Any]]:
+        """Lease up to ``limit`` ready jobs, including ones whose lease expired.
+
+        An expired lease means the worker crashed or hung on the job, so it
+        counts as a failed attempt; jobs that keep doing so are parked as
+        ``failed`` instead of being handed out forever.
+        """
+        now = time.time()
+        jobs = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    """
+                    SELECT file_id, op, version, attempts, status
+                    FROM ingest_jobs
+                    WHERE (status = 'pending' AND available_at <= ?)
+                       OR (status = 'leased' AND leased_until <= ?)
+                    ORDER BY available_at
+                    LIMIT ?
+                    """,
+                    (now, now, limit),
+                ).fetchall()
+
+                for file_id, op, version, attempts, status in rows:
+                    if status == "leased":
+                        attempts += 1
+                    if attempts >= self.max_attempts:
+                        self._conn.execute(
+                            """
+                            UPDATE ingest_jobs
+                            SET status = 'failed', attempts = ?, leased_until = 0,
+                                last_error = 'lease expired', updated_at = ?
+                            WHERE file_id = ? AND version = ?
+                            """,
+                            (attempts, now, file_id, version),
+                        )
+                        continue
+
+                    self._conn.execute(
+                        """
+                        UPDATE ingest_jobs
+                        SET status = 'leased', attempts = ?, leased_until = ?,
+                            updated_at = ?
+                        WHERE file_id = ? AND version = ?
+                        """,
+                        (attempts, now + self.lease_seconds, now, file_id, version),
+                    )
+                    jobs.append({
+                        "file_id": file_id,
+                        "op": op,
+                        "version": version,
+                        "attempts": attempts,
+                    })
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return jobs
+
+    def ack(self, file_id: str, version: int) -> bool:
+        """Remove a finished job; ignored if the file was re-enqueued since"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM ingest_jobs WHERE file_id = ? AND version = ?",
+                (file_id, version),
+            )
+        return cursor.rowcount > 0
+
+    def nack(self, file_id: str, version: int, error: str = "") -> Optional[str]:
+        """Schedule a failed job for retry with exponential backoff.
+
+        Returns the job's new status, or None if the job was superseded.
+        Jobs that exhaust ``max_attempts`` are parked as ``failed``.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM ingest_jobs WHERE file_id = ? AND version = ?",
+                (file_id, version),
+            ).fetchone()
+            if row is None:
+                return None
+
+            attempts = row[0] + 1
+            status = "failed" if attempts >= self.max_attempts else "pending"
+            delay = min(
+                self.retry_base_seconds * (2 ** (attempts - 1)),
+                self.retry_max_seconds,
+            )
+            self._conn.execute(
+                """
+                UPDATE ingest_jobs
+                SET status = ?, attempts = ?, available_at = ?, leased_until = 0,
+                    last_error = ?, updated_at = ?
+                WHERE file_id = ? AND version = ?
+                """,
+                (status, attempts, now + delay, error[:1000], now, file_id, version),
+            )
+        return status
+
+    def stats(self) -> Dict[str, int]:
+        """Count jobs by status"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM ingest_jobs GROUP BY status"
+            ).fetchall()
+        counts = {"pending": 0, "leased": 0, "failed": 0}
+        counts.update({status: count for status, count in rows})
+        return counts
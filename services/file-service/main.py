@@ -1,6 +1,7 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, File, UploadFile, HTTPException, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 import os
@@ -10,6 +11,10 @@ import uuid
 from datetime import datetime
 import json
 import mimetypes
+import secrets
+from ingest_queue import IngestQueue, is_text_like
+from preview_cache import PreviewCache, PreviewTooLarge, PREVIEW_FORMATS, normalize_format, snap_size
+from PIL import Image, UnidentifiedImageError
 
 app = FastAPI(title="File Storage Service", version="1.0.0")
 
@@ -26,11 +31,46 @@ app.add_middleware(
 STORAGE_PATH = Path(os.getenv("STORAGE_PATH", "/data/files"))
 METADATA_PATH = Path(os.getenv("METADATA_PATH", "/data/metadata"))
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", 100 * 1024 * 1024))  # 100MB default
+INGEST_QUEUE_PATH = Path(os.getenv("INGEST_QUEUE_PATH", "/data/queue/ingest.db"))
+INGEST_ENABLED = os.getenv("INGEST_ENABLED", "true").lower() == "true"
+INGEST_MAX_CLAIM = int(os.getenv("INGEST_MAX_CLAIM", "32"))
+INGEST_TOKEN = os.getenv("INGEST_TOKEN", "")
+PREVIEW_CACHE_PATH = Path(os.getenv("PREVIEW_CACHE_PATH", "/data/previews"))
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv("PREVIEW_CACHE_MAX_BYTES", 512 * 1024 * 1024))  # 512MB default
+PREVIEW_MAX_DIMENSION = int(os.getenv("PREVIEW_MAX_DIMENSION", "2048"))
+# Decoded size limit for preview sources: a render peaks at about 6 bytes per
+# pixel, so the default 24M pixels keeps two concurrent renders (~150MB each)
+# inside the 512Mi pod limit
+PREVIEW_MAX_PIXELS = int(os.getenv("PREVIEW_MAX_PIXELS", "24000000"))
 
 # Ensure storage directories exist
 STORAGE_PATH.mkdir(parents=True, exist_ok=True)
 METADATA_PATH.mkdir(parents=True, exist_ok=True)
 
+# Durable queue of uploads waiting to be indexed by the LLM service's RAG engine
+ingest_queue = IngestQueue(
+    INGEST_QUEUE_PATH,
+    lease_seconds=float(os.getenv("INGEST_LEASE_SECONDS", "300")),
+    max_attempts=int(os.getenv("INGEST_MAX_ATTEMPTS", "5")),
+)
+
+# Pillow refuses anything over twice this limit before decoding it
+Image.MAX_IMAGE_PIXELS = PREVIEW_MAX_PIXELS
+
+# Resized image variants served by /preview
+preview_cache = PreviewCache(
+    PREVIEW_CACHE_PATH,
+    max_bytes=PREVIEW_CACHE_MAX_BYTES,
+    workers=int(os.getenv("PREVIEW_WORKERS", "2")),
+    quality=int(os.getenv("PREVIEW_QUALITY", "80")),
+    max_pixels=PREVIEW_MAX_PIXELS,
+)
+
+
+async def enqueue_ingest(file_id: str, op: str):
+    """Queue an ingestion job off the event loop, since SQLite may wait on its lock"""
+    await run_in_threadpool(ingest_queue.enqueue, file_id, op)
+
 
 class FileMetadata(BaseModel):
     id: str
@@ -47,6 +87,19 @@ class FileListResponse(BaseModel):
     total: int
 
 
+class IngestJob(BaseModel):
+    file_id: str
+    op: str
+    version: int
+    attempts: int = 0
+
+
+class IngestResult(BaseModel):
+    file_id: str
+    version: int
+    error: Optional[str] = None
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -98,6 +151,13 @@ async def upload_file(file: UploadFile = File(...)):
         with open(metadata_file, "w") as f:
             json.dump(metadata.model_dump(), f)
         
+        # Queue text uploads for RAG indexing; the upload itself is already stored
+        if INGEST_ENABLED and is_text_like(metadata.content_type, metadata.original_filename):
+            try:
+                await enqueue_ingest(file_id, "index")
+            except Exception as e:
+                print(f"Failed to queue file {file_id} for indexing: {e}")
+        
         return metadata
     
     except Exception as e:
@@ -183,6 +243,64 @@ async def stream_file(file_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/preview/stats")
+async def preview_stats():
+    """Get preview cache hit/miss and bytes-saved metrics"""
+    return preview_cache.get_stats()
+
+
+@app.get("/preview/{file_id}")
+async def preview_file(
+    file_id: str,
+    w: int = Query(256, ge=1),
+    h: int = Query(256, ge=1),
+    format: str = "webp"
+):
+    """Get a resized preview of an image, fitted within w x h"""
+    try:
+        fmt = normalize_format(format)
+        if fmt is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported format. Use one of: jpg, {', '.join(PREVIEW_FORMATS)}"
+            )
+        # Round sizes up to a few buckets so each image has a bounded set of variants
+        w = snap_size(w, PREVIEW_MAX_DIMENSION)
+        h = snap_size(h, PREVIEW_MAX_DIMENSION)
+        
+        # Load metadata
+        metadata_file = METADATA_PATH / f"{file_id}.json"
+        if not metadata_file.exists():
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        with open(metadata_file, "r") as f:
+            metadata = FileMetadata(**json.load(f))
+        
+        if not metadata.content_type.startswith("image/"):
+            raise HTTPException(status_code=415, detail="File is not an image")
+        
+        file_path = Path(metadata.path)
+        if not file_path.exists():
+            raise HTTPException(status_code=404, detail="File not found on disk")
+        
+        preview = await preview_cache.get(file_id, file_path, metadata.size, w, h, fmt)
+        
+        return Response(
+            content=preview,
+            media_type=PREVIEW_FORMATS[fmt][1],
+            headers={"Cache-Control": "public, max-age=86400"}
+        )
+    
+    except HTTPException:
+        raise
+    except (PreviewTooLarge, Image.DecompressionBombError):
+        raise HTTPException(status_code=415, detail="Image is too large to preview")
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=415, detail="Unsupported or corrupt image")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/metadata/{file_id}", response_model=FileMetadata)
 async def get_file_metadata(file_id: str):
     """Get file metadata"""
@@ -236,6 +354,16 @@ async def delete_file(file_id: str):
         with open(metadata_file, "r") as f:
             metadata = FileMetadata(**json.load(f))
         
+        # Queue removal from the RAG index before deleting anything, so a
+        # queue failure leaves the file in place and the delete can be retried
+        if INGEST_ENABLED and is_text_like(metadata.content_type, metadata.original_filename):
+            try:
+                await enqueue_ingest(file_id, "delete")
+            except Exception as e:
+                raise HTTPException(
+                    status_code=503, detail=f"Could not queue index removal: {e}"
+                )
+        
         # Delete file
         file_path = Path(metadata.path)
         if file_path.exists():
@@ -244,6 +372,9 @@ async def delete_file(file_id: str):
         # Delete metadata
         metadata_file.unlink()
         
+        # Drop cached previews
+        preview_cache.remove(file_id)
+        
         return {"status": "success", "message": f"File {file_id} deleted"}
     
     except HTTPException:
@@ -252,6 +383,62 @@ async def delete_file(file_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def verify_ingest_token(x_ingest_token: str = Header("")):
+    """Restrict the internal ingestion endpoints to the LLM service"""
+    if INGEST_TOKEN and not secrets.compare_digest(x_ingest_token, INGEST_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid ingest token")
+
+
+# Internal queue endpoints for the LLM service; the public gateway blocks /ingest/.
+# Handlers are plain functions so FastAPI runs the blocking SQLite calls in its threadpool
+ingest_router = APIRouter(prefix="/ingest", dependencies=[Depends(verify_ingest_token)])
+
+
+@ingest_router.post("/claim", response_model=List[IngestJob])
+def claim_ingest_jobs(limit: int = 8):
+    """Lease a batch of pending ingestion jobs"""
+    try:
+        limit = max(1, min(limit, INGEST_MAX_CLAIM))
+        return ingest_queue.claim(limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@ingest_router.post("/ack")
+def ack_ingest_jobs(results: List[IngestResult]):
+    """Mark ingestion jobs as done"""
+    try:
+        acked = sum(ingest_queue.ack(r.file_id, r.version) for r in results)
+        return {"status": "success", "acked": acked}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@ingest_router.post("/nack")
+def nack_ingest_jobs(results: List[IngestResult]):
+    """Return failed ingestion jobs to the queue for retry"""
+    try:
+        statuses = {
+            r.file_id: ingest_queue.nack(r.file_id, r.version, r.error or "")
+            for r in results
+        }
+        return {"status": "success", "jobs": statuses}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@ingest_router.get("/stats")
+def ingest_stats():
+    """Get ingestion queue depth by status"""
+    try:
+        return ingest_queue.stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+app.include_router(ingest_router)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,298 @@
+from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import ExifTags, Image, ImageOps
+import asyncio
+import io
+import os
+import threading
+import time
+import uuid
+
+
+PREVIEW_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+FORMAT_ALIASES = {"jpg": "jpeg"}
+
+# Requested sizes are rounded up to one of these so each image has few variants
+PREVIEW_SIZES = (64, 128, 256, 512, 1024, 2048)
+
+# Temp files older than this are leftovers from an interrupted generation
+STALE_TEMP_SECONDS = 3600
+
+# Hits refresh a variant's mtime (its LRU position) at most this often
+TOUCH_INTERVAL_SECONDS = 60
+
+# The directory is rescanned once the running usage estimate reaches this
+# share of the quota, or when the last scan is older than the interval
+RESCAN_THRESHOLD = 0.9
+RESCAN_INTERVAL_SECONDS = 60
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class PreviewTooLarge(ValueError):
+    """The source image would take too much memory to decode"""
+
+
+def normalize_format(fmt: str) -> Optional[str]:
+    """Map a requested format to its canonical name, or None if unsupported"""
+    fmt = fmt.lower()
+    fmt = FORMAT_ALIASES.get(fmt, fmt)
+    return fmt if fmt in PREVIEW_FORMATS else None
+
+
+def snap_size(value: int, max_dimension: int) -> int:
+    """Round a requested dimension up to the nearest preview size bucket"""
+    allowed = [size for size in PREVIEW_SIZES if size <= max_dimension] or [PREVIEW_SIZES[0]]
+    for size in allowed:
+        if value <= size:
+            return size
+    return allowed[-1]
+
+
+def render_preview(
+    source: Path,
+    dest: Path,
+    width: int,
+    height: int,
+    fmt: str,
+    quality: int,
+    max_pixels: int = 0,
+) -> bytes:
+    """Resize an image to fit within width x height, store it at dest and return it.
+
+    Raises PreviewTooLarge if the decoded image would exceed ``max_pixels``.
+    """
+    pil_format = PREVIEW_FORMATS[fmt][0]
+    with Image.open(source) as image:
+        # Let the JPEG decoder downscale while decoding instead of after
+        image.draft("RGB", (width, height))
+        if max_pixels and image.width * image.height > max_pixels:
+            raise PreviewTooLarge(
+                f"Image is {image.width}x{image.height}, over the {max_pixels} pixel limit"
+            )
+
+        # Shrink before applying the EXIF rotation so only the small image is
+        # copied; rotated orientations swap the box to fit the final shape
+        if image.getexif().get(ExifTags.Base.Orientation, 1) in TRANSPOSED_ORIENTATIONS:
+            image.thumbnail((height, width), Image.LANCZOS)
+        else:
+            image.thumbnail((width, height), Image.LANCZOS)
+        ImageOps.exif_transpose(image, in_place=True)
+
+        if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+
+        buffer = io.BytesIO()
+        image.save(buffer, pil_format, quality=quality, optimize=True)
+        data = buffer.getvalue()
+
+    # Write to a temp file first so readers never see a partial variant
+    tmp_path = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, dest)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return data
+
+
+class PreviewCache:
+    """Bounded on-disk LRU cache of resized image variants.
+
+    Variants are generated once in a worker pool; concurrent requests in
+    this process for the same variant wait on the same generation. Usage is
+    tracked as a running total of what this process writes. The cache
+    directory may be shared by several processes and pods, so it is
+    rescanned, with file mtimes as the LRU order, when that estimate nears
+    ``max_bytes`` or the last scan is stale. A scan evicts the least
+    recently used variants until the directory fits ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        cache_path: Path,
+        max_bytes: int,
+        workers: int = 2,
+        quality: int = 80,
+        max_pixels: int = 0,
+    ):
+        self.cache_path = Path(cache_path)
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.max_pixels = max_pixels
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preview")
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._usage = {"entries": 0, "size_bytes": 0}
+        self._usage_lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._last_scan = 0.0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "deduplicated": 0,
+            "evictions": 0,
+            "bytes_served": 0,
+            "bytes_saved": 0,
+        }
+        self._evict()
+
+    def variant_name(self, file_id: str, width: int, height: int, fmt: str) -> str:
+        # Quality is part of the key so changing PREVIEW_QUALITY regenerates variants
+        return f"{file_id}_{width}x{height}_q{self.quality}.{fmt}"
+
+    async def get(
+        self, file_id: str, source: Path, source_size: int, width: int, height: int, fmt: str
+    ) -> bytes:
+        """Return the bytes of a variant, generating and caching it if needed.
+
+        The bytes are read before returning, so a concurrent eviction cannot
+        remove the file between lookup and response.
+        """
+        name = self.variant_name(file_id, width, height, fmt)
+        path = self.cache_path / name
+        loop = asyncio.get_event_loop()
+
+        data = None
+        if name not in self._inflight:
+            try:
+                data = await loop.run_in_executor(self._executor, self._read, path)
+                self.stats["hits"] += 1
+            except FileNotFoundError:
+                pass
+
+        # Checked again after the read, since another request may have
+        # started generating this variant while it was awaited
+        if data is None and name in self._inflight:
+            data = await asyncio.shield(self._inflight[name])
+            self.stats["deduplicated"] += 1
+        elif data is None:
+            self.stats["misses"] += 1
+            data = await self._generate(name, source, path, width, height, fmt)
+
+        self.stats["bytes_served"] += len(data)
+        self.stats["bytes_saved"] += max(source_size - len(data), 0)
+        return data
+
+    @staticmethod
+    def _read(path: Path) -> bytes:
+        data = path.read_bytes()
+        try:
+            if time.time() - path.stat().st_mtime > TOUCH_INTERVAL_SECONDS:
+                os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    async def _generate(
+        self, name: str, source: Path, path: Path, width: int, height: int, fmt: str
+    ) -> bytes:
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._inflight[name] = future
+        try:
+            data = await loop.run_in_executor(
+                self._executor, self._render_and_evict, source, path, width, height, fmt
+            )
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; mark retrieved so an unwaited failure is not logged
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(name, None)
+
+    def _render_and_evict(
+        self, source: Path, path: Path, width: int, height: int, fmt: str
+    ) -> bytes:
+        data = render_preview(source, path, width, height, fmt, self.quality, self.max_pixels)
+        with self._usage_lock:
+            self._usage["entries"] += 1
+            self._usage["size_bytes"] += len(data)
+            near_quota = self._usage["size_bytes"] >= self.max_bytes * RESCAN_THRESHOLD
+        stale = time.monotonic() - self._last_scan >= RESCAN_INTERVAL_SECONDS
+
+        # One thread rescans at a time; the others keep the running estimate
+        if (near_quota or stale) and self._scan_lock.acquire(blocking=False):
+            try:
+                self._evict(keep=path.name)
+            finally:
+                self._scan_lock.release()
+        return data
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        """List cached variants as (mtime, name, size), removing stale temp files"""
+        now = time.time()
+        variants = []
+        with os.scandir(self.cache_path) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                    if entry.name.startswith("."):
+                        if now - stat.st_mtime > STALE_TEMP_SECONDS:
+                            os.unlink(entry.path)
+                        continue
+                except FileNotFoundError:
+                    # Removed by another process while scanning
+                    continue
+                variants.append((stat.st_mtime, entry.name, stat.st_size))
+        return variants
+
+    def _evict(self, keep: Optional[str] = None):
+        """Remove least recently used variants until the cache fits its quota"""
+        self._last_scan = time.monotonic()
+        variants = sorted(self._scan())
+        total = sum(size for _, _, size in variants)
+        entries = len(variants)
+
+        for _, name, size in variants:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.unlink(self.cache_path / name)
+                self.stats["evictions"] += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+            entries -= 1
+
+        with self._usage_lock:
+            self._usage = {"entries": entries, "size_bytes": total}
+
+    def remove(self, file_id: str) -> int:
+        """Delete all cached variants of a file"""
+        removed, freed = 0, 0
+        for path in self.cache_path.glob(f"{file_id}_*"):
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += size
+        with self._usage_lock:
+            self._usage["entries"] = max(self._usage["entries"] - removed, 0)
+            self._usage["size_bytes"] = max(self._usage["size_bytes"] - freed, 0)
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cache hit/miss counters and estimated usage"""
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["deduplicated"]
+        return {
+            **self.stats,
+            "hit_ratio": (lookups - self.stats["misses"]) / lookups if lookups else None,
+            **self._usage,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,133 @@
+"""Benchmark the RAG encoder paths.
+
+Compares the original per-call encoding against the micro-batched query
+path (queries/sec) and the in-process and process-pool bulk paths
+(docs/sec), optionally with the int8-quantized encoder.
+
+    python benchmark_encoder.py --queries 256 --concurrency 32 --docs 2000 --processes 2 --quantize
+"""
+from typing import List
+import argparse
+import asyncio
+import random
+import time
+
+from encoder import EncoderService, DEFAULT_MODEL_NAME
+
+
+WORDS = (
+    "python react kubernetes docker fastapi typescript model service portfolio "
+    "experience project developer cloud pipeline database search index vector "
+    "frontend backend testing deploy latency cache stream upload resume skills"
+).split()
+
+
+def make_texts(count: int, words: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=words)) for _ in range(count)]
+
+
+def report(name: str, count: int, unit: str, elapsed: float):
+    print(f"{name:<40} {count / elapsed:>10.1f} {unit}/sec  ({elapsed:.2f}s)")
+
+
+async def bench_latency(service: EncoderService, queries: List[str]):
+    # A lone query pays the batching window, so compare single-query latency too
+    start = time.perf_counter()
+    for query in queries:
+        service.encoder.encode([query])
+    direct = (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    for query in queries:
+        await service.encode_query(query)
+    batched = (time.perf_counter() - start) / len(queries)
+
+    print(f"{'query latency: per-call encode':<40} {direct * 1000:>10.2f} ms")
+    print(f"{'query latency: micro-batched, alone':<40} {batched * 1000:>10.2f} ms")
+
+
+async def bench_queries(service: EncoderService, queries: List[str], concurrency: int):
+    # Baseline: one encode per query on the calling thread, as search() used to do
+    start = time.perf_counter()
+    for query in queries:
+        service.encoder.encode([query])
+    report("query: per-call encode", len(queries), "queries", time.perf_counter() - start)
+
+    # Micro-batched: concurrent searches share encodes
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query: str):
+        async with semaphore:
+            await service.encode_query(query)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(query) for query in queries])
+    report(
+        f"query: micro-batched (c={concurrency})", len(queries), "queries",
+        time.perf_counter() - start,
+    )
+    stats = service.get_stats()
+    print(f"{'':<40} avg batch size {stats['avg_query_batch']:.1f}")
+
+
+async def bench_bulk(service: EncoderService, docs: List[str], label: str):
+    start = time.perf_counter()
+    await service.encode_bulk(docs)
+    report(f"bulk: {label}", len(docs), "docs", time.perf_counter() - start)
+
+
+async def run(args):
+    queries = make_texts(args.queries, 8, seed=1)
+    docs = make_texts(args.docs, 120, seed=2)
+    model_name = args.model
+
+    modes = [False, True] if args.quantize else [False]
+    for quantize in modes:
+        print(f"\n== encoder {'int8-quantized' if quantize else 'fp32'} ==")
+        service = EncoderService(model_name)
+        service.quantize = quantize
+        service.num_processes = 0
+        service.load()
+        for query in queries[:20]:
+            service.encoder.encode([query])
+
+        await bench_latency(service, queries[:args.latency_queries])
+        await bench_queries(service, queries, args.concurrency)
+
+        # Baseline: one encode per document, as index_documents used to do
+        baseline_docs = docs[:min(len(docs), args.baseline_docs)]
+        start = time.perf_counter()
+        for doc in baseline_docs:
+            service.encoder.encode([doc])
+        report("bulk: per-document encode", len(baseline_docs), "docs", time.perf_counter() - start)
+
+        await bench_bulk(service, docs, "batched in-process")
+        await service.close()
+
+        if args.processes > 0:
+            service = EncoderService(model_name)
+            service.quantize = quantize
+            service.num_processes = args.processes
+            service.load()
+            # Pay the worker start-up and model load cost outside the timing
+            await service.encode_bulk(make_texts(args.processes * service.process_chunk_size, 8, seed=3))
+            await bench_bulk(service, docs, f"process pool (p={args.processes})")
+            await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME, help="model name or local path")
+    parser.add_argument("--queries", type=int, default=256, help="number of queries")
+    parser.add_argument("--latency-queries", type=int, default=50, help="queries for the single-query latency test")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent searches")
+    parser.add_argument("--docs", type=int, default=2000, help="number of bulk documents")
+    parser.add_argument("--baseline-docs", type=int, default=500, help="documents for the per-document baseline")
+    parser.add_argument("--processes", type=int, default=0, help="bulk process pool size (0 = skip)")
+    parser.add_argument("--quantize", action="store_true", help="also benchmark the int8 encoder")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
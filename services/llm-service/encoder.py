@@ -0,0 +1,219 @@
+from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from sentence_transformers import SentenceTransformer
+import multiprocessing
+import numpy as np
+import asyncio
+import torch
+import os
+
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def available_cpus() -> int:
+    """CPUs this container may use, honouring cgroup quotas and CPU affinity"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2, then v1; a quota of "max" or -1 means unlimited
+    for quota_file, period_file in (
+        ("/sys/fs/cgroup/cpu.max", None),
+        ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"),
+    ):
+        try:
+            with open(quota_file) as f:
+                values = f.read().split()
+            if period_file is not None:
+                with open(period_file) as f:
+                    values.append(f.read().strip())
+            quota, period = values[0], values[1]
+            if quota not in ("max", "-1"):
+                return max(1, min(cpus, int(quota) // int(period)))
+            break
+        except (OSError, ValueError, IndexError):
+            continue
+    return cpus
+
+
+def load_encoder(model_name: str, quantize: bool = False) -> SentenceTransformer:
+    """Load a sentence transformer, optionally with int8 dynamic quantization"""
+    encoder = SentenceTransformer(model_name, device="cpu" if quantize else None)
+    if quantize:
+        # Dynamic quantization only targets CPU inference of Linear layers
+        encoder = torch.quantization.quantize_dynamic(
+            encoder, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return encoder
+
+
+# Per-process encoder used by the bulk process pool
+_worker_encoder: Optional[SentenceTransformer] = None
+
+
+def _init_worker(model_name: str, quantize: bool, num_threads: int):
+    global _worker_encoder
+    torch.set_num_threads(num_threads)
+    _worker_encoder = load_encoder(model_name, quantize)
+
+
+def _encode_in_worker(texts: List[str], batch_size: int) -> np.ndarray:
+    return np.asarray(
+        _worker_encoder.encode(texts, batch_size=batch_size), dtype=np.float32
+    )
+
+
+class EncoderService:
+    """Embedding layer for the RAG engine.
+
+    Query encodes from concurrent requests are merged into micro-batches
+    collected over a few milliseconds. Bulk encodes run either on a thread
+    in this process or, when ``RAG_ENCODER_PROCESSES`` is set, on a pool of
+    worker processes that each hold their own copy of the model.
+    """
+
+    def __init__(self, model_name: str, bulk_executor: Optional[Executor] = None):
+        self.model_name = model_name
+        self.quantize = os.getenv("RAG_ENCODER_QUANTIZE", "false").lower() == "true"
+        self.batch_window = float(os.getenv("RAG_BATCH_WINDOW_MS", "0")) / 1000
+        self.max_batch_size = int(os.getenv("RAG_MAX_QUERY_BATCH", "64"))
+        self.encode_batch_size = int(os.getenv("RAG_ENCODE_BATCH_SIZE", "32"))
+        self.num_processes = int(os.getenv("RAG_ENCODER_PROCESSES", "0"))
+        self.process_chunk_size = int(os.getenv("RAG_ENCODER_PROCESS_CHUNK", "256"))
+        self.process_threads = int(os.getenv("RAG_ENCODER_THREADS", "0"))
+        self.encoder: Optional[SentenceTransformer] = None
+        self._owns_bulk_executor = bulk_executor is None
+        self.bulk_executor = bulk_executor or ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="rag-bulk"
+        )
+        self.query_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-query")
+        self.process_pool: Optional[ProcessPoolExecutor] = None
+        self.stats = {"queries": 0, "query_batches": 0, "bulk_texts": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_task: Optional[asyncio.Task] = None
+
+    def load(self):
+        """Load the model and start the bulk process pool if configured"""
+        self.encoder = load_encoder(self.model_name, self.quantize)
+
+        if self.num_processes > 0:
+            num_threads = self.process_threads or max(1, available_cpus() // self.num_processes)
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=self.num_processes,
+                # torch is not fork-safe once its thread pools are running
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.quantize, num_threads),
+            )
+
+    def is_loaded(self) -> bool:
+        """Check if the model is loaded"""
+        return self.encoder is not None
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts synchronously in this process"""
+        return np.asarray(
+            self.encoder.encode(texts, batch_size=self.encode_batch_size),
+            dtype=np.float32,
+        )
+
+    async def encode_query(self, text: str) -> np.ndarray:
+        """Encode a single query, batched together with concurrent queries"""
+        if self._batch_task is None or self._batch_task.done():
+            self._queue = asyncio.Queue()
+            self._batch_task = asyncio.create_task(self._batch_loop())
+
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._run_batch(batch)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        # Identical queries in one window share a single encode
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            embeddings = await asyncio.get_event_loop().run_in_executor(
+                self.query_executor, self.encode, texts
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        positions = {text: i for i, text in enumerate(texts)}
+        for text, future in batch:
+            if not future.done():
+                future.set_result(embeddings[positions[text]])
+
+        self.stats["queries"] += len(batch)
+        self.stats["query_batches"] += 1
+
+    async def encode_bulk(self, texts: List[str]) -> np.ndarray:
+        """Encode many texts off the event loop, using the process pool if enabled"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        loop = asyncio.get_event_loop()
+        self.stats["bulk_texts"] += len(texts)
+
+        if self.process_pool is None or len(texts) <= self.encode_batch_size:
+            return await loop.run_in_executor(self.bulk_executor, self.encode, texts)
+
+        slices = [
+            texts[i:i + self.process_chunk_size]
+            for i in range(0, len(texts), self.process_chunk_size)
+        ]
+        results = await asyncio.gather(*[
+            loop.run_in_executor(
+                self.process_pool, _encode_in_worker, part, self.encode_batch_size
+            )
+            for part in slices
+        ])
+        return np.vstack(results)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Batching counters and configuration"""
+        batches = self.stats["query_batches"]
+        return {
+            **self.stats,
+            "avg_query_batch": self.stats["queries"] / batches if batches else 0.0,
+            "quantized": self.quantize,
+            "processes": self.num_processes,
+        }
+
+    async def close(self):
+        """Stop the batching task and worker pools"""
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+            try:
+                await self._batch_task
+            except asyncio.CancelledError:
+                pass
+            self._batch_task = None
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+            self.process_pool = None
+        self.query_executor.shutdown(wait=False)
+        if self._owns_bulk_executor:
+            self.bulk_executor.shutdown(wait=False)
@@ -0,0 +1,268 @@
+from typing import List, Dict, Any, Optional
+from contextlib import contextmanager
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.error import HTTPError
+import urllib.request
+import asyncio
+import codecs
+import json
+import os
+
+from rag_engine import RAGEngine
+
+
+HTML_EXTENSIONS = {".html", ".htm"}
+HTML_CONTENT_TYPES = {"text/html", "application/xhtml+xml"}
+
+
+class _HTMLTextExtractor(HTMLParser):
+    """Incrementally strip markup from HTML, dropping script and style bodies"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts: List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self._skip:
+            self._skip -= 1
+        elif tag in ("p", "div", "br", "li", "h1", "h2", "h3", "h4", "tr"):
+            self._parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._parts.append(data)
+
+    def take(self) -> str:
+        text = "".join(self._parts)
+        self._parts = []
+        return text
+
+
+class TextChunker:
+    """Split a stream of text into overlapping chunks, breaking on whitespace"""
+
+    def __init__(self, chunk_size: int, overlap: int):
+        self.chunk_size = max(chunk_size, 2)
+        # Keep the overlap under half a chunk so every chunk makes real progress
+        self.overlap = max(0, min(overlap, self.chunk_size // 2 - 1))
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        chunks = []
+        while len(self._buffer) >= self.chunk_size:
+            cut = self._buffer.rfind(" ", self.chunk_size // 2, self.chunk_size)
+            if cut == -1:
+                cut = self.chunk_size
+            chunk = self._buffer[:cut].strip()
+            if chunk:
+                chunks.append(chunk)
+            self._buffer = self._buffer[max(cut - self.overlap, 1):]
+        return chunks
+
+    def close(self) -> List[str]:
+        chunk = self._buffer.strip()
+        self._buffer = ""
+        return [chunk] if chunk else []
+
+
+class IngestionWorker:
+    """Background consumer of file-service's ingestion queue.
+
+    Claims jobs in batches, streams each file's text into chunks, and
+    batch-embeds them into the RAG index. Work is pulled only after the
+    previous batch is done, and yields while chat requests are in flight.
+    """
+
+    def __init__(self, rag_engine: RAGEngine):
+        self.rag_engine = rag_engine
+        self.file_service_url = os.getenv("FILE_SERVICE_URL", "http://file-service:8001").rstrip("/")
+        self.enabled = os.getenv("RAG_INGEST_ENABLED", "true").lower() == "true"
+        self.batch_size = int(os.getenv("RAG_INGEST_BATCH_SIZE", "4"))
+        self.poll_interval = float(os.getenv("RAG_INGEST_POLL_INTERVAL", "5"))
+        self.max_poll_interval = float(os.getenv("RAG_INGEST_MAX_POLL_INTERVAL", "60"))
+        self.chunk_size = int(os.getenv("RAG_CHUNK_SIZE", "1000"))
+        self.chunk_overlap = int(os.getenv("RAG_CHUNK_OVERLAP", "150"))
+        self.max_chars = int(os.getenv("RAG_INGEST_MAX_CHARS", str(2 * 1024 * 1024)))
+        self.max_defer = float(os.getenv("RAG_INGEST_MAX_DEFER", "30"))
+        self.request_timeout = float(os.getenv("RAG_INGEST_TIMEOUT", "30"))
+        self.ingest_token = os.getenv("INGEST_TOKEN", "")
+        self.active_requests = 0
+        self.stats = {"indexed": 0, "removed": 0, "failed": 0, "chunks": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start consuming the queue in the background"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        print(f"Ingestion worker polling {self.file_service_url}")
+
+    async def stop(self):
+        """Stop the background consumer"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def is_running(self) -> bool:
+        """Check if the worker is running"""
+        return self._task is not None and not self._task.done()
+
+    @contextmanager
+    def foreground(self):
+        """Mark a latency-sensitive request so ingestion backs off while it runs"""
+        self.active_requests += 1
+        try:
+            yield
+        finally:
+            self.active_requests -= 1
+
+    async def _wait_for_idle(self):
+        """Hold off ingestion while chats are running, up to max_defer seconds"""
+        waited = 0.0
+        while self.active_requests > 0 and waited < self.max_defer:
+            await asyncio.sleep(0.1)
+            waited += 0.1
+
+    async def _run(self):
+        delay = self.poll_interval
+        while True:
+            try:
+                jobs = await self._request("POST", f"/ingest/claim?limit={self.batch_size}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ingestion queue unavailable: {e}")
+                jobs = []
+
+            if not jobs:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+                continue
+
+            delay = self.poll_interval
+            await self._process_batch(jobs)
+
+    async def _process_batch(self, jobs: List[Dict[str, Any]]):
+        done, failed = [], []
+        changed = False
+        for job in jobs:
+            await self._wait_for_idle()
+            try:
+                if job["op"] == "delete":
+                    self.rag_engine.remove_file(job["file_id"])
+                    self.stats["removed"] += 1
+                else:
+                    await self._index_file(job["file_id"])
+                    self.stats["indexed"] += 1
+                changed = True
+                done.append({"file_id": job["file_id"], "version": job["version"]})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Failed to ingest file {job['file_id']}: {e}")
+                self.stats["failed"] += 1
+                failed.append({
+                    "file_id": job["file_id"],
+                    "version": job["version"],
+                    "error": str(e),
+                })
+
+        # Persist before acking so an acked job is never lost on restart;
+        # unreported jobs are re-claimed once their lease expires
+        try:
+            if changed:
+                await self.rag_engine.save()
+            if done:
+                await self._request("POST", "/ingest/ack", done)
+            if failed:
+                await self._request("POST", "/ingest/nack", failed)
+        except Exception as e:
+            print(f"Failed to report ingestion results: {e}")
+
+    async def _index_file(self, file_id: str):
+        try:
+            metadata = await self._request("GET", f"/metadata/{file_id}")
+        except HTTPError as e:
+            if e.code == 404:
+                # Deleted before we got to it; the delete job cleans up the index
+                return
+            raise
+
+        loop = asyncio.get_event_loop()
+        chunks = await loop.run_in_executor(
+            self.rag_engine.bulk_executor,
+            self._read_chunks,
+            file_id,
+            metadata.get("original_filename", ""),
+            metadata.get("content_type", ""),
+        )
+        await self.rag_engine.index_file(
+            file_id,
+            chunks,
+            {"type": "file", "filename": metadata.get("original_filename", file_id)},
+            pause=self._wait_for_idle,
+        )
+        self.stats["chunks"] += len(chunks)
+
+    def _read_chunks(self, file_id: str, filename: str, content_type: str) -> List[str]:
+        """Stream a file from file-service and split it into chunks"""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        is_html = (
+            content_type.split(";")[0].strip().lower() in HTML_CONTENT_TYPES
+            or Path(filename).suffix.lower() in HTML_EXTENSIONS
+        )
+        html = _HTMLTextExtractor() if is_html else None
+        chunker = TextChunker(self.chunk_size, self.chunk_overlap)
+        chunks: List[str] = []
+        read_chars = 0
+
+        request = urllib.request.Request(
+            f"{self.file_service_url}/stream/{file_id}", headers=self._headers()
+        )
+        with urllib.request.urlopen(request, timeout=self.request_timeout) as response:
+            while read_chars < self.max_chars:
+                block = response.read(64 * 1024)
+                text = decoder.decode(block, final=not block)
+                if html is not None:
+                    html.feed(text)
+                    text = html.take()
+                read_chars += len(text)
+                chunks.extend(chunker.feed(text))
+                if not block:
+                    break
+
+        if html is not None:
+            html.close()
+            chunks.extend(chunker.feed(html.take()))
+        chunks.extend(chunker.close())
+        return chunks
+
+    def _headers(self) -> Dict[str, str]:
+        return {"X-Ingest-Token": self.ingest_token} if self.ingest_token else {}
+
+    async def _request(self, method: str, path: str, body: Any = None) -> Any:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._request_sync, method, path, body)
+
+    def _request_sync(self, method: str, path: str, body: Any = None) -> Any:
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(
+            f"{self.file_service_url}{path}",
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json", **self._headers()},
+        )
+        with urllib.request.urlopen(request, timeout=self.request_timeout) as response:
+            return json.loads(response.read() or b"null")
@@ -7,6 +7,7 @@ import json
 import asyncio
 from llm_handler import LLMHandler
 from rag_engine import RAGEngine
+from ingestion import IngestionWorker
 
 app = FastAPI(title="LLM Chat Service", version="1.0.0")
 
@@ -22,6 +23,7 @@ app.add_middleware(
 # Initialize LLM and RAG
 llm_handler = LLMHandler()
 rag_engine = RAGEngine()
+ingestion_worker = IngestionWorker(rag_engine)
 
 
 class Message(BaseModel):
@@ -45,6 +47,14 @@ async def startup_event():
     """Initialize LLM and RAG on startup"""
     await llm_handler.initialize()
     await rag_engine.initialize()
+    await ingestion_worker.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background ingestion and encoder workers"""
+    await ingestion_worker.stop()
+    await rag_engine.encoder.close()
 
 
 @app.get("/health")
@@ -53,7 +63,8 @@ async def health_check():
     return {
         "status": "healthy",
         "llm_loaded": llm_handler.is_loaded(),
-        "rag_indexed": rag_engine.is_indexed()
+        "rag_indexed": rag_engine.is_indexed(),
+        "ingestion_running": ingestion_worker.is_running()
     }
 
 
@@ -61,20 +72,21 @@ async def health_check():
 async def chat(request: ChatRequest):
     """Non-streaming chat endpoint"""
     try:
-        # Get relevant context from RAG if enabled
-        context = ""
-        sources = []
-        if request.use_rag:
-            rag_results = await rag_engine.search(request.message)
-            context = rag_results.get("context", "")
-            sources = rag_results.get("sources", [])
-        
-        # Generate response
-        response = await llm_handler.generate(
-            message=request.message,
-            context=context,
-            history=request.history
-        )
+        with ingestion_worker.foreground():
+            # Get relevant context from RAG if enabled
+            context = ""
+            sources = []
+            if request.use_rag:
+                rag_results = await rag_engine.search(request.message)
+                context = rag_results.get("context", "")
+                sources = rag_results.get("sources", [])
+            
+            # Generate response
+            response = await llm_handler.generate(
+                message=request.message,
+                context=context,
+                history=request.history
+            )
         
         return ChatResponse(response=response, sources=sources)
     
@@ -88,29 +100,30 @@ async def chat_stream(request: ChatRequest):
     
     async def generate_stream():
         try:
-            # Get relevant context from RAG if enabled
-            context = ""
-            sources = []
-            if request.use_rag:
-                rag_results = await rag_engine.search(request.message)
-                context = rag_results.get("context", "")
-                sources = rag_results.get("sources", [])
+            with ingestion_worker.foreground():
+                # Get relevant context from RAG if enabled
+                context = ""
+                sources = []
+                if request.use_rag:
+                    rag_results = await rag_engine.search(request.message)
+                    context = rag_results.get("context", "")
+                    sources = rag_results.get("sources", [])
             
-            # Send sources first
-            if sources:
-                yield f"data: {json.dumps({'type': 'sources', 'data': sources})}\n\n"
+                # Send sources first
+                if sources:
+                    yield f"data: {json.dumps({'type': 'sources', 'data': sources})}\n\n"
             
-            # Stream the response
-            async for chunk in llm_handler.generate_stream(
-                message=request.message,
-                context=context,
-                history=request.history
-            ):
-                yield f"data: {json.dumps({'type': 'token', 'data': chunk})}\n\n"
-                await asyncio.sleep(0)  # Allow other tasks to run
+                # Stream the response
+                async for chunk in llm_handler.generate_stream(
+                    message=request.message,
+                    context=context,
+                    history=request.history
+                ):
+                    yield f"data: {json.dumps({'type': 'token', 'data': chunk})}\n\n"
+                    await asyncio.sleep(0)  # Allow other tasks to run
             
-            # Send completion signal
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                # Send completion signal
+                yield f"data: {json.dumps({'type': 'done'})}\n\n"
         
         except Exception as e:
             yield f"data: {json.dumps({'type': 'error', 'data': str(e)})}\n\n"
@@ -145,6 +158,22 @@ async def search_rag(query: str, top_k: int = 5):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/rag/encoder/stats")
+async def encoder_stats():
+    """Embedding batch and pool statistics"""
+    return rag_engine.encoder.get_stats()
+
+
+@app.get("/rag/ingest/status")
+async def ingest_status():
+    """Background ingestion status"""
+    return {
+        "running": ingestion_worker.is_running(),
+        "active_requests": ingestion_worker.active_requests,
+        **ingestion_worker.stats
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,22 +1,31 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Awaitable, Callable, Optional
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import faiss
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import json
 import os
+from encoder import EncoderService, DEFAULT_MODEL_NAME
 
 
 class RAGEngine:
     """Retrieval-Augmented Generation Engine using FAISS"""
     
     def __init__(self):
-        self.encoder = None
         self.index = None
-        self.documents = []
+        self.documents: Dict[int, Dict] = {}
+        self.file_chunks: Dict[str, List[int]] = {}
+        self.next_id = 0
         self.embedding_dim = 384  # all-MiniLM-L6-v2 dimension
-        self.model_name = "sentence-transformers/all-MiniLM-L6-v2"
+        self.model_name = DEFAULT_MODEL_NAME
         self.indexed = False
         self.data_file = os.getenv("RAG_DATA_FILE", "data/resume_data.json")
+        self.index_path = os.getenv("RAG_INDEX_PATH", "data/index")
+        self.ingest_slice_size = int(os.getenv("RAG_INGEST_SLICE_SIZE", "64"))
+        self._index_lock = asyncio.Lock()
+        # Bulk indexing runs on its own thread so it never queues ahead of query encodes
+        self.bulk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-bulk")
+        self.encoder = EncoderService(self.model_name, self.bulk_executor)
     
     async def initialize(self):
         """Initialize the RAG engine"""
@@ -26,10 +35,13 @@ class RAGEngine:
         print("Initializing RAG engine...")
         
         # Load the sentence transformer model
-        self.encoder = SentenceTransformer(self.model_name)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.encoder.load)
         
-        # Create FAISS index
-        self.index = faiss.IndexFlatL2(self.embedding_dim)
+        # Restore ingested files, or create a FAISS index with explicit IDs
+        # so file chunks can be removed
+        if not await loop.run_in_executor(None, self._load_persisted):
+            self.index = faiss.IndexIDMap(faiss.IndexFlatL2(self.embedding_dim))
         
         # Load and index default data if exists
         if os.path.exists(self.data_file):
@@ -94,43 +106,165 @@ class RAGEngine:
         
         return documents
     
+    def _index_files(self):
+        return (
+            os.path.join(self.index_path, "rag.faiss"),
+            os.path.join(self.index_path, "rag_documents.json"),
+        )
+    
+    def _load_persisted(self) -> bool:
+        """Load the index and ingested file chunks saved by save()"""
+        index_file, documents_file = self._index_files()
+        if not (os.path.exists(index_file) and os.path.exists(documents_file)):
+            return False
+        
+        try:
+            index = faiss.read_index(index_file)
+            with open(documents_file, 'r') as f:
+                state = json.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable persisted RAG index: {e}")
+            return False
+        
+        if index.d != self.embedding_dim:
+            print("Ignoring persisted RAG index built with a different model")
+            return False
+        
+        # Only ingested file chunks are kept; static documents are re-indexed
+        # from RAG_DATA_FILE so edits to it take effect on restart
+        stored_ids = set(faiss.vector_to_array(index.id_map).tolist())
+        documents = {int(doc_id): doc for doc_id, doc in state["documents"].items()}
+        file_chunks = {
+            file_id: [doc_id for doc_id in ids if doc_id in stored_ids and doc_id in documents]
+            for file_id, ids in state["file_chunks"].items()
+        }
+        kept_ids = {doc_id for ids in file_chunks.values() for doc_id in ids}
+        stale_ids = [doc_id for doc_id in stored_ids if doc_id not in kept_ids]
+        if stale_ids:
+            index.remove_ids(np.array(stale_ids, dtype=np.int64))
+        
+        self.index = index
+        self.documents = {doc_id: documents[doc_id] for doc_id in kept_ids}
+        self.file_chunks = {file_id: ids for file_id, ids in file_chunks.items() if ids}
+        self.next_id = max(state["next_id"], max(stored_ids, default=-1) + 1)
+        print(f"Restored {len(self.file_chunks)} ingested files from {self.index_path}")
+        return True
+    
+    async def save(self):
+        """Persist the index and ingested file chunks so they survive restarts"""
+        if self.index is None:
+            return
+        
+        async with self._index_lock:
+            state = {
+                "next_id": self.next_id,
+                "file_chunks": {file_id: list(ids) for file_id, ids in self.file_chunks.items()},
+                "documents": {
+                    str(doc_id): self.documents[doc_id]
+                    for ids in self.file_chunks.values()
+                    for doc_id in ids
+                },
+            }
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(self.bulk_executor, self._write_persisted, state)
+    
+    def _write_persisted(self, state: Dict):
+        os.makedirs(self.index_path, exist_ok=True)
+        index_file, documents_file = self._index_files()
+        
+        # Write each file atomically; the index goes first, and chunks missing
+        # from either file are dropped on load
+        faiss.write_index(self.index, index_file + ".tmp")
+        os.replace(index_file + ".tmp", index_file)
+        with open(documents_file + ".tmp", 'w') as f:
+            json.dump(state, f)
+        os.replace(documents_file + ".tmp", documents_file)
+    
+    def _add(self, embeddings: np.ndarray, documents: List[Dict]) -> List[int]:
+        """Add embeddings and their documents to the index"""
+        ids = list(range(self.next_id, self.next_id + len(documents)))
+        self.next_id += len(documents)
+        self.index.add_with_ids(embeddings, np.array(ids, dtype=np.int64))
+        for doc_id, doc in zip(ids, documents):
+            self.documents[doc_id] = doc
+        return ids
+    
     async def index_documents(self, documents: List[Dict]):
         """Index documents for retrieval"""
-        if not self.encoder:
+        if not self.encoder.is_loaded():
             raise RuntimeError("RAG engine not initialized")
         
-        for doc in documents:
-            content = doc.get("content", "")
-            metadata = doc.get("metadata", {})
-            
-            # Generate embedding
-            embedding = self.encoder.encode([content])[0]
-            
-            # Add to FAISS index
-            self.index.add(np.array([embedding], dtype=np.float32))
-            
-            # Store document with metadata
-            self.documents.append({
-                "content": content,
-                "metadata": metadata
-            })
+        if not documents:
+            return
+        
+        documents = [
+            {"content": doc.get("content", ""), "metadata": doc.get("metadata", {})}
+            for doc in documents
+        ]
+        embeddings = await self.encoder.encode_bulk([doc["content"] for doc in documents])
+        async with self._index_lock:
+            self._add(embeddings, documents)
         
         print(f"Indexed {len(documents)} documents")
     
+    async def index_file(
+        self,
+        file_id: str,
+        chunks: List[str],
+        metadata: Dict,
+        pause: Optional[Callable[[], Awaitable[None]]] = None
+    ):
+        """Index the text chunks of an uploaded file, replacing any previous version.
+        
+        Chunks are encoded in slices of ``RAG_INGEST_SLICE_SIZE``, awaiting
+        ``pause`` before each one so large files can yield to chat traffic.
+        """
+        if not self.encoder.is_loaded():
+            raise RuntimeError("RAG engine not initialized")
+        
+        documents = [
+            {"content": chunk, "metadata": {**metadata, "file_id": file_id, "chunk": i}}
+            for i, chunk in enumerate(chunks)
+        ]
+        embeddings = []
+        for start in range(0, len(chunks), self.ingest_slice_size):
+            if pause is not None:
+                await pause()
+            embeddings.append(
+                await self.encoder.encode_bulk(chunks[start:start + self.ingest_slice_size])
+            )
+        
+        # Swap old and new chunks together so searches never see a half-indexed file
+        async with self._index_lock:
+            self.remove_file(file_id)
+            if documents:
+                self.file_chunks[file_id] = self._add(np.vstack(embeddings), documents)
+        
+        print(f"Indexed {len(documents)} chunks from file {file_id}")
+    
+    def remove_file(self, file_id: str) -> int:
+        """Remove all chunks of an uploaded file from the index"""
+        ids = self.file_chunks.pop(file_id, [])
+        if ids:
+            self.index.remove_ids(np.array(ids, dtype=np.int64))
+            for doc_id in ids:
+                self.documents.pop(doc_id, None)
+        return len(ids)
+    
     async def search(self, query: str, top_k: int = 3) -> Dict[str, Any]:
         """Search for relevant documents"""
-        if not self.encoder or not self.index:
+        if not self.encoder.is_loaded() or not self.index:
             raise RuntimeError("RAG engine not initialized")
         
         if len(self.documents) == 0:
             return {"context": "", "sources": []}
         
         # Generate query embedding
-        query_embedding = self.encoder.encode([query])[0]
+        query_embedding = (await self.encoder.encode_query(query)).reshape(1, -1)
         
         # Search in FAISS
         distances, indices = self.index.search(
-            np.array([query_embedding], dtype=np.float32),
+            query_embedding,
             min(top_k, len(self.documents))
         )
         
@@ -138,8 +272,8 @@ class RAGEngine:
         relevant_docs = []
         sources = []
         for idx in indices[0]:
-            if idx < len(self.documents):
-                doc = self.documents[idx]
+            doc = self.documents.get(int(idx))
+            if doc is not None:
                 relevant_docs.append(doc["content"])
                 
                 # Create source reference
@@ -149,6 +283,8 @@ class RAGEngine:
                     source_text += f": {metadata['company']}"
                 elif "category" in metadata:
                     source_text += f": {metadata['category']}"
+                elif "filename" in metadata:
+                    source_text += f": {metadata['filename']}"
                 sources.append(source_text)
         
         # Combine contexts